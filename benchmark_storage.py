@@ -0,0 +1,82 @@
+from core_tools.gui.get_data_for_GUI import read_last_n_rows, read_time_range
+from core_tools.storage.sqlite_log_class import SQLiteLog, convert_csv_log_to_sqlite
+from core_tools.pressure.save_pressure_readings_functions import PRESSURE_LOG_COLUMNS
+import csv
+import os
+import sys
+import tempfile
+import time
+
+'''Compares the CSV and SQLite logging backends: how fast each can be written to, and how fast the GUI can read the last N rows or a time range from them.'''
+#To run script, use format: python3 <benchmark_storage.py filepath> <num_rows (optional, default 1000000)>
+#Everything is written to a temporary folder that is deleted when the script is done.
+
+num_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+interval_sec = 2  # Pretend the rows were logged every 2 seconds, like the pressure logger
+repeats = 5       # Each read is repeated this many times and the fastest time is reported
+
+# Time a function call, returns the fastest of several runs in ms and the result of the last run
+def time_ms(func, repeats=repeats):
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000.0, result
+
+with tempfile.TemporaryDirectory() as tmp_dir:
+    csv_filepath = os.path.join(tmp_dir, 'pressure_log.csv')
+    db_filepath = os.path.join(tmp_dir, 'pressure_log.db')
+    start_unix_time = time.time() - num_rows * interval_sec
+
+    # Bulk write a CSV log
+    start = time.perf_counter()
+    with open(csv_filepath, mode='w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(PRESSURE_LOG_COLUMNS)
+        for i in range(num_rows):
+            unix_time = start_unix_time + i * interval_sec
+            writer.writerow([time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(unix_time)), 'Off', 1700.0 + (i % 100), 'Pascal'])
+    print(f'Write {num_rows} rows to CSV:                 {time.perf_counter() - start:8.2f} s')
+
+    # Bulk convert the same log to SQLite (batched inserts)
+    start = time.perf_counter()
+    convert_csv_log_to_sqlite(csv_filepath, db_filepath, batch_size=10000)
+    print(f'Convert {num_rows} rows to SQLite:            {time.perf_counter() - start:8.2f} s')
+    print(f'File sizes: CSV {os.path.getsize(csv_filepath) / 1e6:.1f} MB, SQLite {os.path.getsize(db_filepath) / 1e6:.1f} MB')
+
+    # Live style writes, one synced row at a time, the way the loggers write
+    live_rows = 200
+    live_csv_filepath = os.path.join(tmp_dir, 'live_log.csv')
+    start = time.perf_counter()
+    with open(live_csv_filepath, mode='a', newline='') as file:
+        writer = csv.writer(file)
+        for i in range(live_rows):
+            writer.writerow(['2025-01-01 00:00:00', 'Off', 1700.0, 'Pascal'])
+            file.flush()
+            os.fsync(file.fileno())
+    print(f'\nLive write (fsync per row), CSV:        {(time.perf_counter() - start) / live_rows * 1000.0:8.3f} ms/row')
+
+    for batch_size in (1, 100):
+        live_db_log = SQLiteLog(os.path.join(tmp_dir, f'live_log_{batch_size}.db'), PRESSURE_LOG_COLUMNS, batch_size=batch_size)
+        start = time.perf_counter()
+        for i in range(live_rows):
+            live_db_log.writerow(start_unix_time + i, ['2025-01-01 00:00:00', 'Off', 1700.0, 'Pascal'])
+        live_db_log.close()
+        print(f'Live write (batch_size={batch_size:<3}), SQLite:   {(time.perf_counter() - start) / live_rows * 1000.0:8.3f} ms/row')
+
+    # Reads, the way the GUI reads
+    print()
+    for n in (10, 1000, 10000, 100000):
+        csv_ms, csv_rows = time_ms(lambda: read_last_n_rows(csv_filepath, n), repeats=1 if n >= 100000 else repeats)
+        db_ms, db_rows = time_ms(lambda: read_last_n_rows(db_filepath, n))
+        assert len(csv_rows) == len(db_rows) == min(n, num_rows)
+        print(f'Last {n:>6} rows:   CSV {csv_ms:10.2f} ms   SQLite {db_ms:10.2f} ms')
+
+    for range_sec in (600, 3600, 24 * 3600):
+        range_start = start_unix_time + (num_rows // 2) * interval_sec
+        range_end = range_start + range_sec
+        csv_ms, csv_rows = time_ms(lambda: read_time_range(csv_filepath, range_start, range_end), repeats=1)
+        db_ms, db_rows = time_ms(lambda: read_time_range(db_filepath, range_start, range_end))
+        assert len(csv_rows) == len(db_rows)
+        print(f'Time range {range_sec:>6} s ({len(db_rows):>5} rows):   CSV {csv_ms:10.2f} ms   SQLite {db_ms:10.2f} ms')
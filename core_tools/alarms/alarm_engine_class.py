@@ -0,0 +1,332 @@
+from collections import deque
+import math
+import operator
+
+'''Classes to keep rolling statistics on live data series and raise alarms when user defined thresholds are crossed.'''
+
+class RollingStatistics:
+    def __init__(self, window_size=None, window_sec=None):
+        # window_size: max number of samples kept in the window (None means no limit on count)
+        # window_sec: max age in seconds of samples kept in the window, relative to the newest sample (None means no limit on age)
+        # At least one of the two must be given, otherwise the window would grow forever
+        if window_size is None and window_sec is None:
+            raise ValueError("RollingStatistics needs a window_size, a window_sec, or both.")
+
+        self.window_size = window_size
+        self.window_sec = window_sec
+
+        self.samples = deque()   # (timestamp, value) pairs currently inside the window, oldest first
+        self.min_deque = deque() # (timestamp, value) pairs with increasing values, front is the window minimum
+        self.max_deque = deque() # (timestamp, value) pairs with decreasing values, front is the window maximum
+
+        # Running mean and sum of squared deviations (Welford's method), updated on every add/remove so nothing is ever recomputed over the whole window
+        self.mean_value = 0.0
+        self.m2 = 0.0
+
+        # Removing values from the running sums builds up rounding error, so they are rebuilt exactly from the window every so often (see remove_oldest)
+        self.evictions = 0   # samples removed since the last rebuild
+        self.m2_peak = 0.0   # largest m2 since the last rebuild, a measure of how big the rounding error can be
+
+    # Add a new sample and drop any samples that have fallen out of the window, amortized O(1) per sample
+    def add(self, timestamp, value):
+        # NaN values (e.g., gauge 'Off') carry no information and would poison the running sums, so they are skipped
+        if value is None or math.isnan(value):
+            return
+
+        # The same tuple object is stored in all three deques so eviction can match it by identity
+        sample = (timestamp, value)
+        self.samples.append(sample)
+
+        # Welford update for adding a value
+        n = len(self.samples)
+        delta = value - self.mean_value
+        self.mean_value += delta / n
+        self.m2 += delta * (value - self.mean_value)
+        self.m2_peak = max(self.m2_peak, self.m2)
+
+        # Monotonic deques: pop everything from the back that can never be the min/max again while this sample is in the window
+        while self.min_deque and self.min_deque[-1][1] >= value:
+            self.min_deque.pop()
+        self.min_deque.append(sample)
+
+        while self.max_deque and self.max_deque[-1][1] <= value:
+            self.max_deque.pop()
+        self.max_deque.append(sample)
+
+        # Evict old samples by count and by age
+        if self.window_size is not None:
+            while len(self.samples) > self.window_size:
+                self.remove_oldest()
+        self.expire(timestamp)
+
+    # Drop samples older than window_sec relative to now, returns True if any were dropped
+    # Called by add with the time of the new sample, and by AlarmEngine.expire so windows empty out when no new samples come in (e.g., the logger stopped)
+    def expire(self, now):
+        expired = False
+        if self.window_sec is not None:
+            while self.samples and now - self.samples[0][0] > self.window_sec:
+                self.remove_oldest()
+                expired = True
+        return expired
+
+    # Remove the oldest sample from the window and undo its contribution to the running statistics
+    def remove_oldest(self):
+        old_sample = self.samples.popleft()
+        old_value = old_sample[1]
+
+        n = len(self.samples)
+        if n == 0:
+            # Reset exactly instead of subtracting, so floating point error can't build up across empty windows
+            self.mean_value = 0.0
+            self.m2 = 0.0
+            self.evictions = 0
+            self.m2_peak = 0.0
+        else:
+            # Welford update for removing a value (inverse of the add step)
+            delta = old_value - self.mean_value
+            self.mean_value -= delta / n
+            self.m2 -= delta * (old_value - self.mean_value)
+            self.m2 = max(self.m2, 0.0) # Clamp small negative values caused by rounding
+
+            # Rebuild the sums exactly once per window length of removals, which keeps the cost amortized O(1) and stops error building up over long runs
+            # Also rebuild right away if m2 has dropped far below its peak (e.g., pump-down from 760 Torr to 1e-6 Torr), since the rounding error left over from the peak would then be larger than m2 itself
+            self.evictions += 1
+            if self.evictions >= n or self.m2 < self.m2_peak * 1e-8:
+                self.rebuild()
+
+        # The oldest sample is only at the front of a monotonic deque if it is still the current min/max
+        if self.min_deque and self.min_deque[0] is old_sample:
+            self.min_deque.popleft()
+        if self.max_deque and self.max_deque[0] is old_sample:
+            self.max_deque.popleft()
+
+    # Recompute the mean and m2 exactly from the samples in the window
+    def rebuild(self):
+        values = [sample[1] for sample in self.samples]
+        self.mean_value = math.fsum(values) / len(values)
+        self.m2 = math.fsum((value - self.mean_value)**2 for value in values)
+        self.evictions = 0
+        self.m2_peak = self.m2
+
+    def count(self):
+        return len(self.samples)
+
+    def mean(self):
+        return self.mean_value if self.samples else math.nan
+
+    # Population standard deviation of the samples in the window
+    def std(self):
+        return math.sqrt(self.m2 / len(self.samples)) if self.samples else math.nan
+
+    def min(self):
+        return self.min_deque[0][1] if self.min_deque else math.nan
+
+    def max(self):
+        return self.max_deque[0][1] if self.max_deque else math.nan
+
+    def last(self):
+        return self.samples[-1][1] if self.samples else math.nan
+
+    # Rate of change in units per second between the oldest and newest sample in the window
+    def rate(self):
+        if len(self.samples) < 2:
+            return math.nan
+        t_old, v_old = self.samples[0]
+        t_new, v_new = self.samples[-1]
+        if t_new == t_old:
+            return math.nan
+        return (v_new - v_old) / (t_new - t_old)
+
+    # Return the value of a statistic by name (e.g., 'mean', 'std', 'min', 'max', 'rate', 'last')
+    def get(self, stat):
+        if stat not in STATISTICS:
+            raise ValueError(f"Unsupported statistic: {stat}. Supported statistics are: {', '.join(STATISTICS)}.")
+        return getattr(self, stat)()
+
+# Statistics and comparisons that can be used in an alarm rule
+STATISTICS = ('last', 'mean', 'std', 'min', 'max', 'rate', 'count')
+COMPARISONS = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le}
+
+class AlarmRule:
+    def __init__(self, name, series, stat, comparison, threshold, window_size=None, window_sec=None):
+        if stat not in STATISTICS:
+            raise ValueError(f"Unsupported statistic: {stat}. Supported statistics are: {', '.join(STATISTICS)}.")
+        if comparison not in COMPARISONS:
+            raise ValueError(f"Unsupported comparison: {comparison}. Supported comparisons are: {', '.join(COMPARISONS)}.")
+
+        self.name = name               # Unique name of the rule, shown in the GUI
+        self.series = series           # Name of the data series the rule watches (e.g., 'Plot Vessel Pressure')
+        self.stat = stat               # Statistic of the window to compare (e.g., 'mean', 'rate')
+        self.comparison = comparison   # String form of the comparison, kept for display
+        self.compare = COMPARISONS[comparison]
+        self.threshold = threshold
+        self.window_size = window_size
+        self.window_sec = window_sec
+
+        self.active = False            # Is the alarm currently raised
+        self.value = math.nan          # Most recent value of the statistic
+        self.window_count = 0          # Number of samples in the window at the last evaluation, 0 means there is no data to show
+
+    # Evaluate the rule against the rolling statistics of its window, returns True if the alarm state changed
+    def evaluate(self, stats):
+        value = stats.get(self.stat)
+        self.value = value
+        self.window_count = stats.count()
+
+        # Comparisons with NaN are always False, so a window without enough data never raises an alarm
+        active = self.compare(value, self.threshold)
+
+        if active != self.active:
+            self.active = active
+            return True
+        return False
+
+    def describe(self):
+        window = []
+        if self.window_size is not None:
+            window.append(f'{self.window_size} samples')
+        if self.window_sec is not None:
+            window.append(f'{self.window_sec} s')
+        return f"{self.series} {self.stat} ({', '.join(window)}) {self.comparison} {self.threshold}"
+
+class AlarmEngine:
+    def __init__(self):
+        self.rules = {}       # rule name -> AlarmRule
+        self.windows = {}     # series -> {(window_size, window_sec): RollingStatistics}
+        self.window_rules = {} # (series, window_size, window_sec) -> list of AlarmRule using that window
+        self.callbacks = []   # functions called as callback(rule) whenever a rule's alarm state changes
+        self.update_callbacks = [] # functions called as callback(series) after new samples of a series have been evaluated
+
+    # Add a rule, rules on the same series with the same window share one RollingStatistics object
+    def add_rule(self, name, series, stat, comparison, threshold, window_size=None, window_sec=None):
+        if name in self.rules:
+            raise ValueError(f"An alarm rule named '{name}' already exists.")
+
+        rule = AlarmRule(name, series, stat, comparison, threshold, window_size, window_sec)
+
+        window_key = (window_size, window_sec)
+        series_windows = self.windows.setdefault(series, {})
+        if window_key not in series_windows:
+            series_windows[window_key] = RollingStatistics(window_size, window_sec)
+        self.window_rules.setdefault((series, window_size, window_sec), []).append(rule)
+
+        self.rules[name] = rule
+        return rule
+
+    # Register a function to be called as callback(rule) whenever an alarm is raised or cleared
+    def add_callback(self, callback):
+        self.callbacks.append(callback)
+
+    # Register a function to be called as callback(series) after new samples of a series have been evaluated (e.g., to show the latest values)
+    # Called once per add_sample or add_samples call, not once per sample
+    def add_update_callback(self, callback):
+        self.update_callbacks.append(callback)
+
+    # Feed one new sample of a series into every window on that series and evaluate only the rules that watch it
+    def add_sample(self, series, timestamp, value):
+        changed = self.evaluate_sample(series, timestamp, value)
+        for callback in self.update_callbacks:
+            callback(series)
+        return changed
+
+    # Feed several samples of a series at once, oldest first
+    def add_samples(self, series, timestamps, values):
+        changed = []
+        for timestamp, value in zip(timestamps, values):
+            changed.extend(self.evaluate_sample(series, timestamp, value))
+        for callback in self.update_callbacks:
+            callback(series)
+        return changed
+
+    # Shared by add_sample and add_samples, updates the windows and rules of the series without calling the update callbacks
+    # Cost is proportional to the number of windows/rules on this series, not the total number of rules or the window length
+    def evaluate_sample(self, series, timestamp, value):
+        series_windows = self.windows.get(series)
+        if series_windows is None:
+            return [] # No rules watch this series
+
+        changed = []
+        for (window_size, window_sec), stats in series_windows.items():
+            stats.add(timestamp, value)
+            for rule in self.window_rules[(series, window_size, window_sec)]:
+                if rule.evaluate(stats):
+                    changed.append(rule)
+
+        for rule in changed:
+            for callback in self.callbacks:
+                callback(rule)
+
+        return changed
+
+    # Drop samples older than each time window relative to now (seconds since the epoch, like the sample timestamps) and re-evaluate the rules of every window that changed
+    # Without this, a window that stops getting samples (e.g., the logger stopped or a gauge reads 'Off') would keep its last statistics and alarm states forever
+    def expire(self, now):
+        changed = []
+        for series, series_windows in self.windows.items():
+            series_expired = False
+            for (window_size, window_sec), stats in series_windows.items():
+                if stats.expire(now):
+                    series_expired = True
+                    for rule in self.window_rules[(series, window_size, window_sec)]:
+                        if rule.evaluate(stats):
+                            changed.append(rule)
+
+            if series_expired:
+                for callback in self.update_callbacks:
+                    callback(series)
+
+        for rule in changed:
+            for callback in self.callbacks:
+                callback(rule)
+
+        return changed
+
+    # Return the rolling statistics object for a series and window (e.g., to display the current mean)
+    def get_statistics(self, series, window_size=None, window_sec=None):
+        return self.windows[series][(window_size, window_sec)]
+
+    def rules_for_series(self, series):
+        return [rule for rule in self.rules.values() if rule.series == series]
+
+    def active_alarms(self):
+        return [rule for rule in self.rules.values() if rule.active]
+
+# Check the rolling statistics against the statistics module, on a random stream and on a step change of many orders of magnitude (like a pump-down)
+def check_against_statistics(window_size=20, num_samples=20000):
+    import random
+    import statistics
+
+    streams = {
+        'random': [random.gauss(760.0, 5.0) for _ in range(num_samples)],
+        'step change': [760.0 + random.gauss(0.0, 1.0) for _ in range(num_samples // 2)] + [1e-6 + random.gauss(0.0, 1e-8) for _ in range(num_samples // 2)],
+    }
+
+    for name, values in streams.items():
+        stats = RollingStatistics(window_size=window_size)
+        worst_mean_error, worst_std_error = 0.0, 0.0
+        for i, value in enumerate(values):
+            stats.add(float(i), value)
+            window = values[max(0, i + 1 - window_size):i + 1]
+            true_mean, true_std = statistics.fmean(window), statistics.pstdev(window)
+            worst_mean_error = max(worst_mean_error, abs(stats.mean() - true_mean) / abs(true_mean))
+            if true_std > 0:
+                worst_std_error = max(worst_std_error, abs(stats.std() - true_std) / true_std)
+            assert stats.min() == min(window) and stats.max() == max(window)
+
+        print(f'{name}: worst relative error of mean {worst_mean_error:.2e}, std {worst_std_error:.2e}')
+        assert worst_mean_error < 1e-6 and worst_std_error < 1e-6
+
+# Example usage
+if __name__ == '__main__':
+    check_against_statistics()
+
+    engine = AlarmEngine()
+    engine.add_rule('Pressure high', series='Vessel Pressure', stat='mean', comparison='>', threshold=760.0, window_size=5)
+    engine.add_rule('Pressure rising', series='Vessel Pressure', stat='rate', comparison='>', threshold=1.0, window_sec=10)
+    engine.add_callback(lambda rule: print(f"{'RAISED' if rule.active else 'CLEARED'}: {rule.name} ({rule.describe()}), value = {rule.value}"))
+
+    for t in range(30):
+        engine.add_sample('Vessel Pressure', timestamp=float(t), value=750.0 + 0.1 * t**2)
+
+    # No new samples for a while, so the 10 s window empties out and the rate alarm clears
+    engine.expire(now=100.0)
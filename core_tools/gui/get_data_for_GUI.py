@@ -1,9 +1,32 @@
 import pandas as pd
 from datetime import datetime
 import numpy as np
+import time
+import os
+from contextlib import closing
+from ..storage.sqlite_log_class import LOG_TABLE, is_sqlite_filepath, connect_read_only
 
 '''This module provides functions to read data from a CSV file and process it for GUI display.'''
 
+def get_log_watch_paths(csv_filepath):
+    # Files that change when a new row is logged, for the GUI to watch
+    # SQLite logs in WAL mode write new rows to the -wal file first and only copy them into the main file later
+    if is_sqlite_filepath(csv_filepath):
+        return [csv_filepath, csv_filepath + '-wal']
+    return [csv_filepath]
+
+def get_log_signature(csv_filepath):
+    # Size and modification time of every watched file, if this is the same as the last time the log was read then no rows were added
+    # Files that don't exist (e.g., the -wal file before the logger has started) are recorded as None
+    signature = []
+    for path in get_log_watch_paths(csv_filepath):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_size, stat.st_mtime_ns))
+        except FileNotFoundError:
+            signature.append(None)
+    return tuple(signature)
+
 def count_lines(csv_filepath):
     # Open the file in binary mode ('rb') for efficient line counting
     with open(csv_filepath, 'rb') as f:
@@ -12,6 +35,10 @@ def count_lines(csv_filepath):
         return sum(1 for _ in f)
     
 def read_last_n_rows(csv_filepath, n):
+    # SQLite logs can seek straight to the last n rows using the index on time instead of counting every line
+    if is_sqlite_filepath(csv_filepath):
+        return read_last_n_rows_sqlite(csv_filepath, n)
+
     # Count the total number of lines in the file (including the header line)
     total_lines = count_lines(csv_filepath)
 
@@ -34,6 +61,62 @@ def read_last_n_rows(csv_filepath, n):
     # Read the CSV file, skipping the early rows but keeping the header
     return pd.read_csv(csv_filepath, skiprows=skip)
 
+def read_last_n_rows_sqlite(db_filepath, n):
+    # Walk the time index backwards to get the newest n rows, then flip them back into oldest first order like the CSV
+    query = f'SELECT * FROM (SELECT * FROM {LOG_TABLE} ORDER BY unix_time DESC LIMIT ?) ORDER BY unix_time'
+    with closing(connect_read_only(db_filepath)) as conn:
+        return pd.read_sql_query(query, conn, params=(int(n),))
+
+def get_row_count(csv_filepath):
+    # Number of data rows in the log, used as the starting position for read_rows_after
+    if is_sqlite_filepath(csv_filepath):
+        # Rows are never deleted, so the rowid of the newest row is the number of rows
+        with closing(connect_read_only(csv_filepath)) as conn:
+            return conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM {LOG_TABLE}').fetchone()[0]
+    return count_lines(csv_filepath) - 1
+
+def read_rows_after(csv_filepath, position):
+    # Read every row logged after the first `position` rows, and return them with the new position (the number of rows read so far)
+    # Positions count rows instead of comparing times, so no row is skipped or read twice, even if several rows have the same time
+    if is_sqlite_filepath(csv_filepath):
+        query = f'SELECT rowid AS log_rowid, * FROM {LOG_TABLE} WHERE rowid > ? ORDER BY rowid'
+        with closing(connect_read_only(csv_filepath)) as conn:
+            dataframe = pd.read_sql_query(query, conn, params=(int(position),))
+        if len(dataframe) > 0:
+            position = int(dataframe['log_rowid'].iloc[-1])
+        return dataframe.drop(columns='log_rowid'), position
+
+    # Skip the first `position` data rows (lines 1 to position, line 0 is the header)
+    skip = range(1, position + 1) if position > 0 else None
+    dataframe = pd.read_csv(csv_filepath, skiprows=skip)
+    return dataframe, position + len(dataframe)
+
+def read_time_range(csv_filepath, start_time, end_time):
+    # start_time and end_time are in seconds since the epoch, rows with start_time <= time <= end_time are returned
+    if is_sqlite_filepath(csv_filepath):
+        return read_time_range_sqlite(csv_filepath, start_time, end_time)
+
+    # A CSV has no index, so the whole file has to be read and filtered
+    dataframe = pd.read_csv(csv_filepath)
+    unix_times = local_times_to_unix(pd.to_datetime(dataframe['Time'], format='%Y-%m-%d %H:%M:%S'))
+    in_range = (unix_times >= start_time) & (unix_times <= end_time)
+    return dataframe[in_range].reset_index(drop=True)
+
+def read_time_range_sqlite(db_filepath, start_time, end_time):
+    # Index range scan, only the rows inside the time range are touched
+    query = f'SELECT * FROM {LOG_TABLE} WHERE unix_time BETWEEN ? AND ? ORDER BY unix_time'
+    with closing(connect_read_only(db_filepath)) as conn:
+        return pd.read_sql_query(query, conn, params=(float(start_time), float(end_time)))
+
+def local_times_to_unix(timestamps):
+    # CSV times are local time without a timezone, so each one is converted with time.mktime, the same as convert_csv_log_to_sqlite
+    # This gives each date its own UTC offset (daylight saving), so CSV and SQLite logs agree on the time of every row
+    # UTC offsets only change on the hour, so mktime is called once per distinct hour instead of once per row
+    naive_seconds = (timestamps - pd.Timestamp(0)).dt.total_seconds()
+    hours = timestamps.dt.floor('h')
+    offsets = {hour: time.mktime(hour.timetuple()) - (hour - pd.Timestamp(0)).total_seconds() for hour in hours.unique()}
+    return naive_seconds + hours.map(offsets)
+
 def get_seconds_ago(dataframe):
     # Convert the 'Time' column in the dataframe from string to datetime objects
     # using the specified format: 'Year-Month-Day Hour:Minute:Second'
@@ -51,6 +134,14 @@ def get_seconds_ago(dataframe):
     # Return the new 'seconds_ago' Series from the dataframe
     return dataframe['seconds_ago']
 
+def get_unix_times(dataframe):
+    # Get the time of each row in seconds since the epoch
+    # Unlike seconds_ago, these don't shift every time the file is read, so they can be used to tell which rows are new
+    # SQLite logs store this directly, for CSV logs convert the 'timestamp' column made by get_seconds_ago
+    if 'unix_time' in dataframe:
+        return dataframe['unix_time']
+    return local_times_to_unix(dataframe['timestamp'])
+
 def get_pressure(dataframe):
     # Convert gauge values to numeric, coercing errors (like 'Off') to NaN
     gauge1 = pd.to_numeric(dataframe['Gauge 1'], errors='coerce')
@@ -102,17 +193,29 @@ def get_temperature(dataframe):
     # Return the pressure values as a pandas Series with the same index as the input DataFrame
     return pd.Series(temperature, name='Temperature', index=dataframe.index)
 
-def get_n_XY_datapoints(csv_filepath, n, datatype):
+#If return_unix_times is True, also returns the absolute time of each row (seconds since the epoch) as a third value, used to feed only new rows into the alarm engine
+def get_n_XY_datapoints(csv_filepath, n, datatype, return_unix_times=False):
     dataframe = read_last_n_rows(csv_filepath, n)
+    return get_XY_datapoints(dataframe, datatype, return_unix_times)
+
+#Same as get_n_XY_datapoints, but returns every row between start_time and end_time (seconds since the epoch) instead of the last n rows
+def get_XY_datapoints_in_time_range(csv_filepath, start_time, end_time, datatype, return_unix_times=False):
+    dataframe = read_time_range(csv_filepath, start_time, end_time)
+    return get_XY_datapoints(dataframe, datatype, return_unix_times)
 
+def get_XY_datapoints(dataframe, datatype, return_unix_times=False):
     # Depending on the requested datatype, process and return the appropriate data
     if datatype == 'pressure':
         times = get_seconds_ago(dataframe)
         pressures = get_pressure(dataframe)
+        if return_unix_times:
+            return times, pressures, get_unix_times(dataframe)
         return times, pressures
     elif datatype == 'temperature':
         times = get_seconds_ago(dataframe)
         temperature = get_temperature(dataframe)
+        if return_unix_times:
+            return times, temperature, get_unix_times(dataframe)
         return times, temperature
     else:
         # Raise an error if the datatype is not supported
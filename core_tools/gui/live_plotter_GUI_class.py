@@ -1,12 +1,14 @@
-from pyqtgraph.Qt import QtWidgets, QtCore
+from pyqtgraph.Qt import QtWidgets, QtCore, QtGui
 import pyqtgraph as pg
 import numpy as np
 import sys
 import pandas as pd
-from .get_data_for_GUI import get_n_XY_datapoints
+from .get_data_for_GUI import get_n_XY_datapoints, get_XY_datapoints, get_log_watch_paths, get_log_signature, get_row_count, read_rows_after
 import subprocess
 import shlex
 import platform
+import math
+import time
 
 '''Class to handle live plotting and add various controls/buttons in a Qt GUI application.'''
 
@@ -77,16 +79,31 @@ class LiveTab(QtWidgets.QWidget):
         # Internal state tracking for plots
         self.data = {}                            # title -> {x: pandas Series, y: pandas Series, buffer_size: int}
         self.curves = {}                          # title -> plot curve
-        self.interval_timers = {}                 # title -> QTimer for updates
+        self.interval_timers = {}                 # title -> QTimer for the slow fallback check for new data
+        self.debounce_timers = {}                 # title -> single shot QTimer that updates the plot shortly after its file changes
+        self.log_signatures = {}                  # title -> size/modification time of the log the last time the plot was updated
+        self.plot_unix_times = {}                 # title -> unix time of each point last read from the log
+        self.plot_y_data = {}                     # title -> y value of each point last read from the log
         self.elapsed_timers = {}                  # title -> QElapsedTimer for time axis
         self.running_state = {}                   # title -> bool: is plot running
         self.start_stop_buttons = {}              # title -> start/stop QPushButton
         self.csv_filepath = {}                    # title -> CSV filepath from logging to pull data from
         self.datatype = {}                        # Datatype for the plots (e.g., 'pressure', 'temperature')
 
+        # One watcher for every log file in the tab, notifies the plots when the logger writes to their file
+        self.file_watcher = QtCore.QFileSystemWatcher()
+        self.file_watcher.fileChanged.connect(self.file_changed)
+
+        # The log is only read when it changes, so this cheap timer moves the points along the "time since present" axis in between
+        # Without it the newest point would stay at 0 s ago until the next write, and a stopped logger would look like a live one
+        self.time_axis_timer = QtCore.QTimer()
+        self.time_axis_timer.timeout.connect(self.shift_time_axes)
+        self.time_axis_timer.start(1000)
+
         #Internal state tracking for command buttons
         self.cmd_buttons = {}                     # title -> QPushButton for terminal commands
-        self.cmd_processes = {}                   # title -> subprocess.Popen object for running commands
+        self.cmd_processes = {}                   # title -> QProcess object for running commands
+        self.stopping_processes = set()           # QProcess objects that have been killed but haven't exited yet
         self.cmd_running_state = {}               # title -> bool: is command running
         self.cmd_command_strings = {}             # title -> command string (useful if we want to change command on the fly)
 
@@ -94,6 +111,15 @@ class LiveTab(QtWidgets.QWidget):
         self.dd_menus = {}                        # title ->
         self.dd_option_names = {}                 # title ->
         self.dd_option_values = {}                 # title ->
+
+        #Internal state tracking for alarms
+        self.alarm_engines = {}                   # plot title -> AlarmEngine the plot's data is fed into
+        self.alarm_series = {}                    # plot title -> series name the plot's data is fed in as
+        self.alarm_positions = {}                 # plot title -> number of log rows already fed into the alarm engine
+        self.alarm_signatures = {}                # plot title -> size/modification time of the log the last time alarms were checked
+        self.alarm_lists = {}                     # alarm panel title -> QListWidget showing the rules
+        self.alarm_items = {}                     # alarm panel title -> {rule name: QListWidgetItem}
+        self.alarm_panel_engines = {}             # alarm panel title -> AlarmEngine shown in the panel
     
     # Add a new plot with button below it
     def add_plot(self, title, x_axis, y_axis, buffer_size, csv_filepath, datatype): #x_axis and y_axis are tuples of (label, unit), and buffer_size is the number of data points to display at once
@@ -146,19 +172,90 @@ class LiveTab(QtWidgets.QWidget):
         x_data, y_data, buffer_size = self.data[title]["x"], self.data[title]["y"], self.data[title]["buffer_size"]
         csv_filepath = self.csv_filepath[title]
         datatype = self.datatype[title]
-        x_data, y_data = get_n_XY_datapoints(csv_filepath, buffer_size, datatype)
-        self.curves[title].setData(x=x_data, y=y_data)
+        x_data, y_data, unix_times = get_n_XY_datapoints(csv_filepath, buffer_size, datatype, return_unix_times=True)
+
+        # Keep the absolute times so the plot can be redrawn against the current time without reading the log again
+        self.plot_unix_times[title] = unix_times.to_numpy()
+        self.plot_y_data[title] = y_data.to_numpy()
+        self.redraw_plot(title)
+
+    # Redraw a plot from the last data read, with x as the seconds between each point and now (negative means in the past)
+    def redraw_plot(self, title):
+        x_data = self.plot_unix_times[title] - time.time()
+        self.curves[title].setData(x=x_data, y=self.plot_y_data[title])
+
+    # Called every second to move the points of every running plot along the time axis
+    # Also expires old samples from the time windows of every alarm engine in the tab, so alarms and panels don't freeze on old data when no new samples come in
+    def shift_time_axes(self):
+        for title in self.plot_unix_times:
+            if self.running_state.get(title):
+                self.redraw_plot(title)
+
+        now = time.time()
+        alarm_engines = list(self.alarm_engines.values()) + list(self.alarm_panel_engines.values())
+        for alarm_engine in {id(engine): engine for engine in alarm_engines}.values():
+            alarm_engine.expire(now)
+
+    # Feed every row logged since the last check into the plot's alarm engine, independent of the plot's buffer size, so each sample is evaluated exactly once
+    def check_alarms(self, title):
+        csv_filepath = self.csv_filepath[title]
+        dataframe, position = read_rows_after(csv_filepath, self.alarm_positions[title])
+        if len(dataframe) > 0:
+            _, y_data, unix_times = get_XY_datapoints(dataframe, self.datatype[title], return_unix_times=True)
+            self.alarm_engines[title].add_samples(self.alarm_series[title], unix_times.to_numpy(), y_data.to_numpy())
+        self.alarm_positions[title] = position
+
+    # Check alarms and update the plot only if the log has changed since they were last done, so unchanged files are never reparsed
+    # Alarms are checked even while the plot is stopped
+    def update_if_changed(self, title):
+        signature = get_log_signature(self.csv_filepath[title])
+        # Signatures are only stored once the read succeeds, so a failed read is retried
+        if title in self.alarm_engines and signature != self.alarm_signatures.get(title):
+            self.check_alarms(title)
+            self.alarm_signatures[title] = signature
+        if self.running_state.get(title) and signature != self.log_signatures.get(title):
+            self.update(title)
+            self.log_signatures[title] = signature
+
+    # Called by the file watcher when a log file is written to
+    def file_changed(self, path):
+        # Some programs replace the file instead of writing to it, which removes it from the watcher, so add it back
+        self.watch_log_files()
+
+        # Start the debounce timer of every running plot (or plot feeding alarms) reading this file, writes that come in while it is already running are grouped into the same update
+        for title in self.debounce_timers:
+            if (self.running_state[title] or title in self.alarm_engines) and path in get_log_watch_paths(self.csv_filepath[title]):
+                if not self.debounce_timers[title].isActive():
+                    self.debounce_timers[title].start()
+
+    # Make sure every log file used by a plot is being watched (e.g., the SQLite -wal file only exists once the logger has started)
+    def watch_log_files(self):
+        watched_files = set(self.file_watcher.files())
+        for title in self.debounce_timers:
+            for path in get_log_watch_paths(self.csv_filepath[title]):
+                if path not in watched_files and QtCore.QFileInfo(path).exists():
+                    self.file_watcher.addPath(path)
+                    watched_files.add(path)
 
     # Return elapsed time in seconds since the plot started
     def get_elapsed_time(self, title):
         return self.elapsed_timers[title].elapsed() / 1000.0 #convert ms to seconds
 
-    # Starts the QTimer that drives the updates for a given plot
-    def start_timer(self, title, interval_ms):
-        # Create a timer to update the plot regularly
+    # Starts the file watcher and timers that drive the updates for a given plot
+    # The plot updates interval_ms after its log file is written to (any more writes in that time are grouped into the same update), and never reads the file if nothing was written
+    # In case a change notification is missed, the file is also checked every fallback_interval_ms and the plot updated if the log changed
+    def start_timer(self, title, interval_ms, fallback_interval_ms=10000):
+        # Create a single shot timer that is started when the file changes
+        debounce_timer = QtCore.QTimer()
+        debounce_timer.setSingleShot(True)
+        debounce_timer.setInterval(interval_ms)
+        debounce_timer.timeout.connect(lambda: self.update_if_changed(title))
+        self.debounce_timers[title] = debounce_timer
+
+        # Create a slow timer as a fallback to the file watcher
         timer = QtCore.QTimer()
-        timer.timeout.connect(lambda: self.update(title))
-        timer.start(interval_ms)
+        timer.timeout.connect(lambda: self.fallback_check(title))
+        timer.start(fallback_interval_ms)
         self.interval_timers[title] = timer
 
         # Start a timer to track elapsed time
@@ -169,11 +266,22 @@ class LiveTab(QtWidgets.QWidget):
         # Mark the plot as running
         self.running_state[title] = True
 
+        # Watch the log file and draw the data that is already there
+        self.watch_log_files()
+        self.update_if_changed(title)
+
+    # Fallback check for new data, also adds watches for log files that didn't exist when the plot started
+    def fallback_check(self, title):
+        self.watch_log_files()
+        self.update_if_changed(title)
+
     # Toggle between start and stop for a given plot
     def toggle_plot(self, title):
         if self.running_state[title]:
-            # Stop the timer and update the button text
-            self.interval_timers[title].stop()
+            # Stop the timers and update the button text, plots feeding alarms keep their timers so alarms are still checked while the plot is stopped
+            if title not in self.alarm_engines:
+                self.interval_timers[title].stop()
+                self.debounce_timers[title].stop()
             self.start_stop_buttons[title].setText(f"Start {title}")
             self.start_stop_buttons[title].setStyleSheet("background-color: green;")
             self.running_state[title] = False
@@ -187,29 +295,47 @@ class LiveTab(QtWidgets.QWidget):
             self.start_stop_buttons[title].setStyleSheet("background-color: red;")
             self.running_state[title] = True
 
-    #Run a terminal command using subprocess
+            # Redraw right away, even if the log hasn't changed while the plot was stopped
+            self.log_signatures.pop(title, None)
+            self.update_if_changed(title)
+
+    #Run a terminal command using QProcess, which tells the GUI when the command exits instead of the GUI having to check
     def run_terminal_command(self, title, command):
         system = platform.system()
 
+        process = QtCore.QProcess()
+        process.setProcessChannelMode(QtCore.QProcess.ForwardedChannels) #Print the command's output to the terminal the GUI was launched from
+
         if system == 'Windows':
-            #Use shlex.split to safely split the command respecting shell syntax
-            cmd_parts = shlex.split(command, posix=False)  # Use posix=False for Windows compatibility
-            process = subprocess.Popen(cmd_parts, shell=True) #Use shell=True for Windows to handle commands correctly
+            #Run through cmd so Windows commands and paths are handled the same way as typing them into a terminal
+            process.setProgram('cmd.exe')
+            process.setNativeArguments(f'/c {command}')
         else:
+            #Use shlex.split to safely split the command respecting shell syntax
             cmd_parts = shlex.split(command)
-            process = subprocess.Popen(cmd_parts)
-        
+            process.setProgram(cmd_parts[0])
+            process.setArguments(cmd_parts[1:])
+
+        #Reset the button as soon as the process exits (or fails to start)
+        process.finished.connect(lambda exit_code, exit_status, t=title, p=process: self.command_finished(t, p))
+        process.errorOccurred.connect(lambda error, t=title, p=process: self.command_finished(t, p) if error == QtCore.QProcess.FailedToStart else None)
+
         self.cmd_processes[title] = process
+        process.start()
     
     #Terminate a running terminal command
     def stop_terminal_command(self, title):
         process = self.cmd_processes[title]
 
         #Check if the process is still running and terminate it
-        if process and process.poll() is None:
+        #The GUI doesn't wait for it to exit, command_finished is called when it does
+        if process and process.state() != QtCore.QProcess.NotRunning:
+            #Keep a reference until it exits, so it isn't destroyed while still running if the button starts a new one first
+            self.stopping_processes.add(process)
+
             system = platform.system()
             if system == 'Windows':
-                subprocess.run(['taskkill', '/PID', str(process.pid), '/T', '/F'], check=True)
+                subprocess.run(['taskkill', '/PID', str(process.processId()), '/T', '/F']) #No check=True, the process may have exited on its own in the meantime
             else:
                 process.kill()
     
@@ -264,17 +390,27 @@ class LiveTab(QtWidgets.QWidget):
         # Mark the command as not running
         self.cmd_running_state[title] = False
     
+    # Called by a QProcess when it exits, reverts the button to its original state
+    def command_finished(self, title, process):
+        self.stopping_processes.discard(process)
+
+        # Ignore processes that have already been replaced (e.g., the button was clicked to stop and then start again)
+        if self.cmd_processes.get(title) is not process:
+            return
+
+        cmd_button = self.cmd_buttons[title]
+        cmd_button.setText(f'Start {title}')
+        cmd_button.setStyleSheet("background-color: green;")
+        self.cmd_running_state[title] = False
+
     # Check the status of all command processes and update button states
     def check_command_status(self):
         for title in self.cmd_processes:
             process = self.cmd_processes[title]
-            if process.poll() is not None:
-                # Process has finished, update button state
-                cmd_button = self.cmd_buttons[title]
-                cmd_button.setText(f'Start {title}')
-                cmd_button.setStyleSheet("background-color: green;")
-                self.cmd_running_state[title] = False
+            if process.state() == QtCore.QProcess.NotRunning:
+                self.command_finished(title, process)
     
+    # No longer needed since command_finished is called when a process exits, kept so existing launch files still work
     def cmd_timer(self, interval_ms):
         # Create a timer to check command status on a regular interval
         timer = QtCore.QTimer()
@@ -324,6 +460,74 @@ class LiveTab(QtWidgets.QWidget):
         container_widget.setMaximumWidth(500) #prevent stretching (aesthetics)
         self.layout.addWidget(container_widget, row, col)
 
+    #Feed every new row of a plot's log into an AlarmEngine, series defaults to the plot title
+    #The last history_rows rows already in the log are fed in right away so the alarm windows start out full
+    def add_plot_to_alarms(self, title, alarm_engine, series=None, history_rows=100):
+        self.alarm_engines[title] = alarm_engine
+        self.alarm_series[title] = series if series is not None else title
+        self.alarm_positions[title] = max(0, get_row_count(self.csv_filepath[title]) - history_rows)
+
+        self.alarm_signatures.pop(title, None)
+        self.update_if_changed(title)
+
+    #Add a list showing every rule of an AlarmEngine, rules turn red while their alarm is raised and green when cleared
+    #Add the rules to the engine before calling this so they are listed from the start (rules added later show up when they first change state)
+    def add_alarm_panel(self, title, alarm_engine):
+        index = self.plot_counts
+        plots_per_row = self.plots_per_row
+        self.plot_counts += 1
+        row = index // plots_per_row
+        col = index % plots_per_row
+
+        # Vertical layout to hold the label and list
+        container = QtWidgets.QVBoxLayout()
+
+        # Label
+        label = QtWidgets.QLabel(title)
+        container.addWidget(label)
+
+        # List with one row per rule
+        alarm_list = QtWidgets.QListWidget()
+        self.alarm_lists[title] = alarm_list
+        self.alarm_panel_engines[title] = alarm_engine
+        self.alarm_items[title] = {}
+        for rule in alarm_engine.rules.values():
+            self.update_alarm_item(title, rule)
+
+        # Update the rules of a series every time new samples of it are evaluated, so the list always shows the latest values
+        alarm_engine.add_update_callback(lambda series, t=title, engine=alarm_engine: self.update_alarm_items(t, engine, series))
+
+        container.addWidget(alarm_list)
+
+        # Wrap the layout in a QWidget and add it to the grid
+        container_widget = QtWidgets.QWidget()
+        container_widget.setLayout(container)
+        self.layout.addWidget(container_widget, row, col)
+
+    #Update the text and color of a rule in an alarm panel
+    def update_alarm_item(self, title, rule):
+        items = self.alarm_items[title]
+        if rule.name not in items:
+            items[rule.name] = QtWidgets.QListWidgetItem()
+            self.alarm_lists[title].addItem(items[rule.name])
+
+        item = items[rule.name]
+        if rule.active:
+            item.setText(f'ALARM - {rule.name}: {rule.describe()} (value: {rule.value:.4g})')
+            item.setBackground(QtGui.QColor('red'))
+        elif rule.window_count == 0 or math.isnan(rule.value):
+            # Nothing has been evaluated yet, the window is empty (e.g., every sample expired after the logger stopped), or it doesn't have enough data (e.g., rate needs two samples)
+            item.setText(f'NO DATA - {rule.name}: {rule.describe()}')
+            item.setBackground(QtGui.QColor('gray'))
+        else:
+            item.setText(f'OK - {rule.name}: {rule.describe()} (value: {rule.value:.4g})')
+            item.setBackground(QtGui.QColor('green'))
+
+    #Update every rule of a series in an alarm panel, called by the alarm engine after new samples of the series are evaluated
+    def update_alarm_items(self, title, alarm_engine, series):
+        for rule in alarm_engine.rules_for_series(series):
+            self.update_alarm_item(title, rule)
+
     #Changes the command string associated with a specified command button based on the title of the button
     def change_cmd_button_command(self, title, new_command):
         self.cmd_command_strings[title] = new_command
@@ -345,18 +549,26 @@ class LiveTab(QtWidgets.QWidget):
     #Change the buffer size of a specified plot, intended to be attached to a dropdown menu
     def change_buffer_size(self, title, ctrl_title, dropdown_text, new_option_value):
         self.data[ctrl_title]["buffer_size"] = new_option_value
+        self.refresh_plot(ctrl_title)
 
     #Change the buffer size of multiple plots at once, intended to be attached to a dropdown menu
     #ctrl_titles is a list of titles that correspond to the plots to change
     def change_buffer_size_multiple(self, title, ctrl_titles, dropdown_text, new_option_value):
         for i in range(len(ctrl_titles)):
             self.data[str(ctrl_titles[i])]["buffer_size"] = new_option_value
+            self.refresh_plot(str(ctrl_titles[i]))
+
+    #Redraw a running plot right away instead of waiting for the log to change (e.g., after its buffer size changes)
+    def refresh_plot(self, title):
+        if self.running_state.get(title):
+            self.log_signatures.pop(title, None)
+            self.update_if_changed(title)
     
     # End all running subprocesses
     def cleanup(self):
         for title in self.cmd_processes:
             process = self.cmd_processes[title]
-            if process.poll() is None:
+            if process.state() != QtCore.QProcess.NotRunning:
                 self.stop_terminal_command(title)
         
 
@@ -376,7 +588,6 @@ if __name__ == '__main__':
 
     pressure_tab.add_command_button(title='Log Vessel Pressure', command=f'.venv\Scripts\python.exe 40L_run_control/log_pressure.py {pressure_log_filepath} COM4 2')
     pressure_tab.add_command_button(title='test', command=f'timeout /T 10')
-    pressure_tab.cmd_timer(500)
 
     temp_tab.add_plot(title='Plot VMM 1 Temperature', x_axis=('Time since present', 's'), y_axis=('Temperature', 'deg C'), buffer_size=100, csv_filepath=pressure_log_filepath, datatype='pressure')
     temp_tab.start_timer(title='Plot VMM 1 Temperature', interval_ms=1000)
@@ -388,6 +599,5 @@ if __name__ == '__main__':
     temp_tab.start_timer(title='Plot VMM 3 Temperature', interval_ms=1000)
 
     temp_tab.add_command_button(title='test', command=f'timeout /T 10')
-    temp_tab.cmd_timer(500)
 
     plotter.run()
\ No newline at end of file
@@ -2,8 +2,12 @@ import time
 import csv
 import os
 from .pressure_sensor_serial_class import PressureSensorSerial
+from ..storage.sqlite_log_class import SQLiteLog, is_sqlite_filepath
 
-'''Functions to handle pressure readings and log them to a CSV file'''
+'''Functions to handle pressure readings and log them to a CSV file (or an SQLite database if the filepath ends in .db, .sqlite, or .sqlite3)'''
+
+# Column headers of the pressure log, shared by the CSV and SQLite formats
+PRESSURE_LOG_COLUMNS = ['Time', 'Gauge 1', 'Gauge 2', 'Units']
 
 # Converts string to float unless the value is 'Off', in which case it leaves it as 'Off'
 def convert_str_to_float(value):
@@ -16,31 +20,51 @@ def get_pressure_readings(sensor):
     return convert_str_to_float(gauge1), convert_str_to_float(gauge2), units
 
 # Creates a new CSV file with a header row if it doesn't already exist
+# If the filepath is an SQLite database, creates the database and its table instead
 def create_pressure_log_csv(filepath):
-    if not os.path.exists(filepath):  # Check if the file already exists
+    if is_sqlite_filepath(filepath):
+        SQLiteLog(filepath, PRESSURE_LOG_COLUMNS).close()  # Creating the log makes the table and time index if they don't exist
+    elif not os.path.exists(filepath):  # Check if the file already exists
         with open(filepath, mode='w', newline='') as file:  # Open in write mode
             writer = csv.writer(file)
-            writer.writerow(['Time', 'Gauge 1', 'Gauge 2', 'Units'])  # Write column headers
+            writer.writerow(PRESSURE_LOG_COLUMNS)  # Write column headers
 
 #Logs pressure readings to CSV at regular intervals indefinitely or for a set duration
-def log_pressure_to_csv(sensor, filepath, interval_sec, duration_sec=None): #None by default means run indefinitely unless specified
-    start_time = time.time()
-
-    with open(filepath, mode='a', newline='') as file:  # Open in append mode
-        writer = csv.writer(file)
+#If the filepath is an SQLite database, readings are inserted db_batch_size rows per transaction (1 by default so the GUI sees every reading right away)
+def log_pressure_to_csv(sensor, filepath, interval_sec, duration_sec=None, db_batch_size=1): #None by default means run indefinitely unless specified
+    if is_sqlite_filepath(filepath):
+        db_log = SQLiteLog(filepath, PRESSURE_LOG_COLUMNS, batch_size=db_batch_size)
+        try:
+            log_pressure_readings(sensor, interval_sec, duration_sec, db_log.writerow)
+        finally:
+            db_log.close()  # Write any readings still waiting for a full batch
+    else:
+        with open(filepath, mode='a', newline='') as file:  # Open in append mode
+            writer = csv.writer(file)
 
-        while duration_sec is None or time.time() - start_time < duration_sec:  # Loop indefinitely or keep looping until time is up
-            gauge1, gauge2, units = get_pressure_readings(sensor)  # Read current values
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S')         # Format current time
+            def write_csv_row(unix_time, row):
+                writer.writerow(row)  # Write to CSV
+                file.flush()               # Flush Python’s internal buffer
+                os.fsync(file.fileno())   # Force OS to flush file to disk
 
-            writer.writerow([timestamp, gauge1, gauge2, units])  # Write to CSV
-            file.flush()               # Flush Python’s internal buffer
-            os.fsync(file.fileno())   # Force OS to flush file to disk
-            print(f"{timestamp} - Gauge1: {gauge1}, Gauge2: {gauge2}, Units: {units}")  # Console log, uncomment for debugging
-            time.sleep(interval_sec)  # Wait before next reading
+            log_pressure_readings(sensor, interval_sec, duration_sec, write_csv_row)
 
     sensor.close_port()  # Close serial connection when done
 
+#Takes readings at regular intervals and passes each one to write_row(unix_time, row), where row is in the order of PRESSURE_LOG_COLUMNS
+def log_pressure_readings(sensor, interval_sec, duration_sec, write_row):
+    start_time = time.time()
+
+    while duration_sec is None or time.time() - start_time < duration_sec:  # Loop indefinitely or keep looping until time is up
+        gauge1, gauge2, units = get_pressure_readings(sensor)  # Read current values
+        unix_time = time.time()
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(unix_time))         # Format current time
+
+        write_row(unix_time, [timestamp, gauge1, gauge2, units])
+        print(f"{timestamp} - Gauge1: {gauge1}, Gauge2: {gauge2}, Units: {units}")  # Console log, uncomment for debugging
+
+        time.sleep(interval_sec)  # Wait before next reading
+
 # Example usage
 if __name__ == '__main__':
     log_filepath = '40L_run_control/pressure_log.csv'  # CSV log file path
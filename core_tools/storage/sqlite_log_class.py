@@ -0,0 +1,85 @@
+import sqlite3
+import csv
+import time
+from pathlib import Path
+
+'''Class to log data to an SQLite database instead of a CSV, with an index on time so the GUI can read the last N rows or a time range without scanning the whole log.'''
+
+# Every log database has one table with this name, holding the same columns as the equivalent CSV plus a unix_time column used for indexing
+LOG_TABLE = 'log'
+
+# File extensions that are treated as SQLite databases instead of CSV files by the loggers and the GUI
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+# Returns True if the filepath should be read/written as an SQLite database instead of a CSV
+def is_sqlite_filepath(filepath):
+    return str(filepath).lower().endswith(SQLITE_EXTENSIONS)
+
+# Quote a column name so names with spaces (e.g., 'Gauge 1') can be used in SQL
+def quote_column(name):
+    return '"' + name.replace('"', '""') + '"'
+
+# Open a read only connection, used by the GUI so it can never lock out or modify the logger's database
+def connect_read_only(filepath):
+    return sqlite3.connect(Path(filepath).resolve().as_uri() + '?mode=ro', uri=True)
+
+class SQLiteLog:
+    def __init__(self, filepath, columns, batch_size=1):
+        # filepath: path to the database file, created if it doesn't exist
+        # columns: list of column names, same as the headers of the equivalent CSV (e.g., ['Time', 'Gauge 1', 'Gauge 2', 'Units'])
+        # batch_size: number of rows to hold in memory before inserting them in a single transaction
+        # Use 1 for live logging so the GUI sees every row right away, and larger numbers for bulk imports
+        self.filepath = filepath
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.pending_rows = []
+
+        self.conn = sqlite3.connect(filepath)
+
+        # WAL mode lets the GUI read while the logger writes without either one blocking the other
+        # synchronous=FULL syncs the WAL to disk on every commit, the same guarantee as the fsync after every CSV row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=FULL')
+
+        column_defs = ', '.join(quote_column(column) for column in self.columns)
+        self.conn.execute(f'CREATE TABLE IF NOT EXISTS {LOG_TABLE} (unix_time REAL NOT NULL, {column_defs})')
+        self.conn.execute(f'CREATE INDEX IF NOT EXISTS {LOG_TABLE}_unix_time ON {LOG_TABLE} (unix_time)')
+        self.conn.commit()
+
+        placeholders = ', '.join('?' for _ in range(len(self.columns) + 1))
+        self.insert_sql = f'INSERT INTO {LOG_TABLE} VALUES ({placeholders})'
+
+    # Queue a row to be written, unix_time is the time of the row in seconds since the epoch, row is a list of values in the same order as columns
+    def writerow(self, unix_time, row):
+        self.pending_rows.append((unix_time, *row))
+        if len(self.pending_rows) >= self.batch_size:
+            self.flush()
+
+    # Insert all queued rows in a single transaction
+    def flush(self):
+        if self.pending_rows:
+            with self.conn: # Commits on success, rolls back on error
+                self.conn.executemany(self.insert_sql, self.pending_rows)
+            self.pending_rows = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+# Copy an existing CSV log into a new or existing SQLite database, the CSV headers are used as the column names
+# The CSV must have a 'Time' column formatted as 'Year-Month-Day Hour:Minute:Second' (as written by the loggers)
+def convert_csv_log_to_sqlite(csv_filepath, db_filepath, batch_size=10000):
+    with open(csv_filepath, mode='r', newline='') as file:
+        reader = csv.reader(file)
+        columns = next(reader)
+        time_index = columns.index('Time')
+
+        log = SQLiteLog(db_filepath, columns, batch_size=batch_size)
+        for row in reader:
+            unix_time = time.mktime(time.strptime(row[time_index], '%Y-%m-%d %H:%M:%S'))
+            log.writerow(unix_time, row)
+        log.close()
+
+# Example usage
+if __name__ == '__main__':
+    convert_csv_log_to_sqlite('40L_run_control/pressure_log.csv', '40L_run_control/pressure_log.db')
@@ -23,7 +23,6 @@ pressure_tab.add_dropdown_menu(title='# data points shown', option_names=['10',
 pressure_tab.add_dropdown_menu(title='Pressure log increment', option_names=['2s', '10s', '1m', '10m', '1hr'], option_values=[2, 10, 60, 600, 600*6], ctrl_var='Log Vessel Pressure', on_change_callback=pressure_tab.change_pressure_log_cmd)
 
 pressure_tab.add_command_button(title='Log Vessel Pressure', command=f'.venv\Scripts\python.exe 40L_run_control/log_pressure.py {pressure_log_filepath} COM4 2')
-pressure_tab.cmd_timer(500)
 
 num_vmms = 32
 temp_ctrl_titles = []